@@ -5,15 +5,22 @@ Fetches from Google News RSS across multiple broad queries,
 deduplicates, scores for relevance, and outputs a static HTML page.
 """
 
-import urllib.request
-import urllib.parse
+import http.client
+import threading
+from urllib.parse import parse_qsl, quote, urlencode, urlparse, urlunparse
 import xml.etree.ElementTree as ET
+import heapq
 import html
+import io
+import os
 import re
+import string
 import json
 import hashlib
 from datetime import datetime, timedelta, timezone
-from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ─────────────────────────────────────────────────────────────
 # CONFIGURATION — Edit these to tune your feed
@@ -22,6 +29,21 @@ from collections import OrderedDict
 MAX_ITEMS = 15
 MAX_AGE_DAYS = 60
 
+# Number of RSS queries fetched concurrently
+FETCH_WORKERS = 16
+
+GOOGLE_NEWS_HOST = 'news.google.com'
+FETCH_TIMEOUT = 15
+MAX_REDIRECTS = 3
+USER_AGENT = 'Mozilla/5.0 (compatible; DefenseFeedBot/1.0)'
+
+# Per-query ETag/Last-Modified and parsed articles, kept between runs so
+# unchanged feeds come back as 304 Not Modified and skip parsing.
+# Bump CACHE_VERSION whenever the article dicts from parse_rss change shape.
+CACHE_DIR = '.feed-cache'
+CACHE_INDEX = os.path.join(CACHE_DIR, 'cache.json')
+CACHE_VERSION = 1
+
 # Multiple broad queries to cast a wide net.
 # Google News RSS supports OR, quotes, etc.
 QUERIES = [
@@ -128,7 +150,24 @@ TAG_RULES = {
     ],
 }
 
-# Sources to deprioritize (content farms, press release aggregators)
+# Terms that boost an article's score when they appear in its title
+HIGH_VALUE_TERMS = [
+    'defense tech', 'defence tech', 'drone', 'uav', 'ukraine',
+    'funding', 'investment', 'series', 'venture', 'startup',
+    'itar', 'export', 'european defense', 'eu defense',
+    'dual-use', 'autonomous', 'counter-drone',
+]
+
+# Sources to boost (matched against source name and link)
+PREMIUM_SOURCES = [
+    'reuters', 'bloomberg', 'financial times', 'defense one',
+    'defensenews', 'janes', 'breaking defense', 'the war zone',
+    'techcrunch', 'sifted', 'pitchbook', 'crunchbase',
+    'business wire', 'globenewswire', 'defense post',
+]
+
+# Domains to deprioritize (content farms, press release aggregators);
+# subdomains match too, e.g. finance.yahoo.com
 LOW_QUALITY_SOURCES = [
     'yahoo.com', 'msn.com',
 ]
@@ -137,18 +176,100 @@ LOW_QUALITY_SOURCES = [
 # SCRAPER
 # ─────────────────────────────────────────────────────────────
 
-def fetch_google_news_rss(query):
-    """Fetch articles from Google News RSS for a given query."""
-    encoded = urllib.parse.quote(query)
-    url = f"https://news.google.com/rss/search?q={encoded}&hl=en&gl=US&ceid=US:en"
+class _KeepOnly(dict):
+    """str.translate table that deletes every character not listed."""
+    def __missing__(self, key):
+        return None
+
+
+# Keeps [a-z0-9 ] and drops everything else. ASCII is tabulated up front
+# so only non-ASCII characters fall through to __missing__.
+_TITLE_KEEP = set(string.ascii_lowercase + string.digits + ' ')
+_TITLE_TRANS = _KeepOnly(
+    (i, chr(i) if chr(i) in _TITLE_KEEP else None) for i in range(128)
+)
+
+_RE_HTML = re.compile(r'<[^<]+?>')
+_RE_TRACKING_PARAM = re.compile(r'^(utm_|fbclid|gclid)')
+
+# Config lists lowercased once at import. Terms and premium sources are
+# substring-matched, so they stay tuples; low-quality sources are domains
+# compared by equality, so they become a set.
+_HIGH_VALUE_TERMS = tuple(t.lower() for t in HIGH_VALUE_TERMS)
+_PREMIUM_SOURCES = tuple(s.lower() for s in PREMIUM_SOURCES)
+_LOW_QUALITY = frozenset(s.lower() for s in LOW_QUALITY_SOURCES)
+
+# TAG_RULES keywords lowercased once, so tagging doesn't call .lower()
+# for every keyword of every article
+_TAG_KEYWORDS = {
+    tag: tuple(kw.lower() for kw in keywords)
+    for tag, keywords in TAG_RULES.items()
+}
+
+# Every query hits the same host, so each worker thread keeps one
+# keep-alive connection open instead of re-doing the TLS handshake.
+_local = threading.local()
+
+
+def get_connection():
+    """Return this thread's persistent connection to Google News."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = http.client.HTTPSConnection(GOOGLE_NEWS_HOST, timeout=FETCH_TIMEOUT)
+        _local.conn = conn
+    return conn
+
+
+def http_get(path, headers, retry=True):
+    """GET a path on this thread's connection; returns (status, body, headers).
+
+    A reused keep-alive connection may have been closed by the server while
+    idle, so a reset on one is retried once on a fresh connection.
+    """
+    conn = get_connection()
+    reused = conn.sock is not None
+    try:
+        conn.request('GET', path, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, resp.read(), resp.headers
+    except Exception as e:
+        # Drop the connection so the next request on this thread starts clean
+        conn.close()
+        _local.conn = None
+        # RemoteDisconnected is a ConnectionResetError
+        if retry and reused and isinstance(e, (ConnectionResetError, BrokenPipeError)):
+            return http_get(path, headers, retry=False)
+        raise
+
+
+def fetch_google_news_rss(query, validators=None):
+    """Fetch the Google News RSS feed for a given query.
+
+    `validators` are extra request headers for a conditional GET. Same-host
+    redirects are followed, as urllib.request did. Returns
+    (status, body, headers), or None if the fetch failed.
+    """
+    encoded = quote(query)
+    path = f"/rss/search?q={encoded}&hl=en&gl=US&ceid=US:en"
+    headers = {'User-Agent': USER_AGENT, **(validators or {})}
     
     try:
-        req = urllib.request.Request(url, headers={
-            'User-Agent': 'Mozilla/5.0 (compatible; DefenseFeedBot/1.0)'
-        })
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = resp.read()
-        return data
+        for _ in range(MAX_REDIRECTS + 1):
+            status, data, resp_headers = http_get(path, headers)
+            if status not in (301, 302, 303, 307, 308):
+                break
+            location = urlparse(resp_headers.get('Location', ''))
+            if location.netloc and location.netloc != GOOGLE_NEWS_HOST:
+                raise http.client.HTTPException(
+                    f"HTTP {status} redirect to another host: {location.netloc}"
+                )
+            path = urlunparse(location._replace(scheme='', netloc='')) or '/'
+        else:
+            raise http.client.HTTPException(f"more than {MAX_REDIRECTS} redirects")
+        
+        if status not in (200, 304):
+            raise http.client.HTTPException(f"HTTP {status}")
+        return status, data, resp_headers
     except Exception as e:
         print(f"  ⚠ Failed to fetch '{query}': {e}")
         return None
@@ -161,47 +282,168 @@ def parse_rss(xml_data):
     
     articles = []
     try:
-        root = ET.fromstring(xml_data)
-        for item in root.findall('.//item'):
+        # Stream items and clear each one once read, so only a single
+        # <item> subtree is held in memory regardless of feed size
+        for _, item in ET.iterparse(io.BytesIO(xml_data), events=('end',)):
+            if item.tag != 'item':
+                continue
+            
             title = item.findtext('title', '').strip()
             link = item.findtext('link', '').strip()
             pub_date_str = item.findtext('pubDate', '').strip()
             source = item.findtext('source', '').strip()
+            source_el = item.find('source')
+            source_url = source_el.get('url', '') if source_el is not None else ''
             description = item.findtext('description', '').strip()
             
-            # Parse date
+            # Parse date (RFC 2822; handles both "GMT" and "+0200" zones)
             pub_date = None
             if pub_date_str:
                 try:
-                    pub_date = datetime.strptime(
-                        pub_date_str, '%a, %d %b %Y %H:%M:%S %Z'
-                    ).replace(tzinfo=timezone.utc)
-                except ValueError:
-                    try:
-                        pub_date = datetime.strptime(
-                            pub_date_str, '%a, %d %b %Y %H:%M:%S %z'
-                        )
-                    except ValueError:
-                        pass
+                    pub_date = parsedate_to_datetime(pub_date_str)
+                except (TypeError, ValueError):
+                    pass
+                else:
+                    # "-0000" means UTC but comes back naive
+                    if pub_date.tzinfo is None:
+                        pub_date = pub_date.replace(tzinfo=timezone.utc)
             
             if title and link:
-                articles.append({
+                article = {
                     'title': html.unescape(title),
                     'link': link,
                     'date': pub_date,
                     'source': html.unescape(source) if source else extract_domain(link),
-                    'description': html.unescape(re.sub('<[^<]+?>', '', description)),
-                })
+                    'description': html.unescape(_RE_HTML.sub('', description)),
+                }
+                # Lowercased copies shared by dedup, tagging and scoring
+                article['_title_lower'] = article['title'].lower()
+                article['_desc_lower'] = article['description'].lower()
+                article['_source_lower'] = article['source'].lower()
+                article['_link_lower'] = link.lower()
+                # Links are Google News redirects, so take the publisher's
+                # domain from <source url="..."> when it is present
+                article['_domain'] = extract_domain(source_url or link)
+                articles.append(article)
+            
+            item.clear()
     except ET.ParseError as e:
         print(f"  ⚠ XML parse error: {e}")
     
     return articles
 
 
+def load_cache():
+    """Load the query -> {etag, last_modified, body_sha} cache index.
+
+    An index written by a different CACHE_VERSION is ignored, so articles
+    parsed by older code are never replayed.
+    """
+    try:
+        with open(CACHE_INDEX, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('queries', {})
+
+
+def save_cache(cache):
+    """Write the cache index and drop article files no query refers to."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(CACHE_INDEX, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'queries': cache}, f,
+                      indent=1, sort_keys=True)
+        
+        live = {f"{entry['body_sha']}.json" for entry in cache.values()}
+        for name in os.listdir(CACHE_DIR):
+            if name != os.path.basename(CACHE_INDEX) and name not in live:
+                os.remove(os.path.join(CACHE_DIR, name))
+    except OSError as e:
+        print(f"  ⚠ Failed to save RSS cache: {e}")
+
+
+def load_cached_articles(body_sha):
+    """Return the articles parsed from a cached body, or None if unusable."""
+    try:
+        with open(os.path.join(CACHE_DIR, f'{body_sha}.json'), encoding='utf-8') as f:
+            articles = json.load(f)
+        for a in articles:
+            a['date'] = datetime.fromisoformat(a['date']) if a['date'] else None
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    return articles
+
+
+def store_cached_articles(body_sha, articles):
+    """Save parsed articles under the hash of the body they came from."""
+    path = os.path.join(CACHE_DIR, f'{body_sha}.json')
+    # Identical bodies can be written by two workers at once, so write to
+    # a per-thread temp file and rename it into place
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump([
+                {**a, 'date': a['date'].isoformat() if a['date'] else None}
+                for a in articles
+            ], f)
+        os.replace(tmp, path)
+    except OSError as e:
+        # Caching is best-effort; a missing file just means a full fetch
+        print(f"  ⚠ Failed to cache articles: {e}")
+
+
+def fetch_articles(query, entry=None):
+    """Fetch and parse one query, reusing cached articles when unchanged.
+
+    Returns (articles, cache_entry). A failed fetch returns no articles
+    but passes the old entry through so it is tried again next run.
+    """
+    validators = {}
+    if entry:
+        if entry.get('etag'):
+            validators['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            validators['If-Modified-Since'] = entry['last_modified']
+    
+    result = fetch_google_news_rss(query, validators)
+    if result is None:
+        return [], entry
+    status, data, headers = result
+    
+    if status == 304:
+        articles = load_cached_articles(entry.get('body_sha')) if entry else None
+        if articles is not None:
+            return articles, entry
+        if not validators:
+            print(f"  ⚠ Failed to fetch '{query}': HTTP 304 to an unconditional request")
+            return [], None
+        # Nothing usable cached for this query, so refetch unconditionally
+        return fetch_articles(query)
+    
+    body_sha = hashlib.sha256(data).hexdigest()
+    articles = None
+    if entry and entry.get('body_sha') == body_sha:
+        # Server ignored the validators but the feed has not changed
+        articles = load_cached_articles(body_sha)
+    if articles is None:
+        articles = parse_rss(data)
+        store_cached_articles(body_sha, articles)
+    
+    return articles, {
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'body_sha': body_sha,
+    }
+
+
+@lru_cache(maxsize=2048)
 def extract_domain(url):
     """Extract a readable domain from a URL."""
     try:
-        from urllib.parse import urlparse
         parsed = urlparse(url)
         domain = parsed.netloc.replace('www.', '')
         return domain
@@ -209,13 +451,33 @@ def extract_domain(url):
         return ''
 
 
+def _canonical_url(link):
+    """Normalize a link for dedup: drop tracking params and the fragment."""
+    try:
+        parsed = urlparse(link)
+    except ValueError:
+        return link.lower()
+    query = urlencode([
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if not _RE_TRACKING_PARAM.match(k)
+    ])
+    return urlunparse(parsed._replace(netloc=parsed.netloc.lower(), query=query, fragment=''))
+
+
 def deduplicate(articles):
-    """Remove duplicate articles based on normalized title similarity."""
-    seen = OrderedDict()
+    """Remove duplicate articles by canonical URL, then by normalized title."""
+    # Cheap first pass: the same story returned by several queries
+    by_url = {}
     for a in articles:
+        key = _canonical_url(a['link'])
+        existing = by_url.get(key)
+        if existing is None or is_better_source(a, existing):
+            by_url[key] = a
+    
+    seen = {}  # dicts keep insertion order
+    for a in by_url.values():
         # Normalize: lowercase, strip punctuation, collapse whitespace
-        norm = re.sub(r'[^a-z0-9 ]', '', a['title'].lower())
-        norm = re.sub(r'\s+', ' ', norm).strip()
+        norm = ' '.join(a['_title_lower'].translate(_TITLE_TRANS).split())
         
         # Use first 60 chars as dedup key (catches reposts with minor diffs)
         key = norm[:60]
@@ -231,80 +493,74 @@ def deduplicate(articles):
     return list(seen.values())
 
 
+@lru_cache(maxsize=1024)
+def is_low_quality_domain(domain):
+    """Check a domain and its parent domains against LOW_QUALITY_SOURCES."""
+    parts = domain.split('.')
+    return any('.'.join(parts[i:]) in _LOW_QUALITY for i in range(len(parts) - 1))
+
+
 def is_better_source(new, existing):
     """Prefer higher-quality sources."""
-    for domain in LOW_QUALITY_SOURCES:
-        if domain in (existing.get('source', '') + existing.get('link', '')).lower():
-            return True
-    return False
+    return (is_low_quality_domain(existing['_domain'])
+            and not is_low_quality_domain(new['_domain']))
 
 
-def assign_tags(article):
-    """Assign topic tags based on title keywords."""
-    title_lower = article['title'].lower()
-    desc_lower = article.get('description', '').lower()
-    text = title_lower + ' ' + desc_lower
-    
+@lru_cache(maxsize=4096)
+def _tags_for(text):
+    """Tags matched in a lowercased title + description (cached)."""
     tags = []
-    for tag, keywords in TAG_RULES.items():
+    for tag, keywords in _TAG_KEYWORDS.items():
         for kw in keywords:
-            if kw.lower() in text:
+            if kw in text:
                 tags.append(tag)
                 break
+    return tuple(tags)
+
+
+def assign_tags(article):
+    """Assign topic tags based on title keywords."""
+    tags = _tags_for(article['_title_lower'] + ' ' + article['_desc_lower'])
     
-    return tags if tags else ['Defense Tech']
+    return list(tags) if tags else ['Defense Tech']
 
 
-def score_article(article, tags):
+def score_article(article, tags, now):
     """Score article for relevance ranking. Higher = more relevant."""
     score = 0
     
     # Recency bonus (newer = better)
     if article['date']:
-        age_days = (datetime.now(timezone.utc) - article['date']).days
+        age_days = (now - article['date']).days
         score += max(0, 60 - age_days)  # up to 60 points for brand new
     
     # Tag diversity bonus
     score += len(tags) * 8
     
     # Title keyword density
-    title_lower = article['title'].lower()
-    high_value_terms = [
-        'defense tech', 'defence tech', 'drone', 'uav', 'ukraine',
-        'funding', 'investment', 'series', 'venture', 'startup',
-        'itar', 'export', 'european defense', 'eu defense',
-        'dual-use', 'autonomous', 'counter-drone',
-    ]
-    for term in high_value_terms:
+    title_lower = article['_title_lower']
+    for term in _HIGH_VALUE_TERMS:
         if term in title_lower:
             score += 5
     
     # Source quality bonus
-    premium_sources = [
-        'reuters', 'bloomberg', 'financial times', 'defense one',
-        'defensenews', 'janes', 'breaking defense', 'the war zone',
-        'techcrunch', 'sifted', 'pitchbook', 'crunchbase',
-        'business wire', 'globenewswire', 'defense post',
-    ]
-    source_lower = article.get('source', '').lower()
-    link_lower = article.get('link', '').lower()
-    for ps in premium_sources:
+    source_lower = article['_source_lower']
+    link_lower = article['_link_lower']
+    for ps in _PREMIUM_SOURCES:
         if ps in source_lower or ps in link_lower:
             score += 10
             break
     
     # Penalize low-quality sources
-    for domain in LOW_QUALITY_SOURCES:
-        if domain in source_lower or domain in link_lower:
-            score -= 15
-            break
+    if is_low_quality_domain(article['_domain']):
+        score -= 15
     
     return score
 
 
-def filter_by_date(articles, max_age_days):
+def filter_by_date(articles, max_age_days, now):
     """Filter articles to only include those within max_age_days."""
-    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    cutoff = now - timedelta(days=max_age_days)
     filtered = []
     for a in articles:
         if a['date'] is None:
@@ -314,12 +570,11 @@ def filter_by_date(articles, max_age_days):
     return filtered
 
 
-def format_date(dt):
+def format_date(dt, now):
     """Format date as relative time or absolute date."""
     if not dt:
         return 'Recently'
     
-    now = datetime.now(timezone.utc)
     diff = now - dt
     
     if diff.days == 0:
@@ -341,24 +596,27 @@ def format_date(dt):
 def generate_html(articles, generated_at):
     """Generate the static HTML page."""
     
-    items_html = ''
+    parts = []
     for i, (article, tags, score) in enumerate(articles):
         tags_html = ''.join(
             f'<span class="tag">{t}</span>' for t in tags
         )
         
-        date_str = format_date(article['date'])
-        source = article.get('source', 'Unknown')
+        date_str = format_date(article['date'], generated_at)
+        link = html.escape(article['link'])
+        source = html.escape(article.get('source', 'Unknown'))
+        title = html.escape(article['title'])
         
-        items_html += f'''
-        <a href="{html.escape(article['link'])}" target="_blank" rel="noopener" class="item" style="animation-delay: {i * 0.04}s">
+        parts.append(f'''
+        <a href="{link}" target="_blank" rel="noopener" class="item" style="animation-delay: {i * 0.04}s">
             <div class="item-header">
-                <span class="source">{html.escape(source)}</span>
+                <span class="source">{source}</span>
                 <span class="date">{date_str}</span>
             </div>
-            <h3 class="item-title">{html.escape(article['title'])}</h3>
+            <h3 class="item-title">{title}</h3>
             <div class="tags">{tags_html}</div>
-        </a>'''
+        </a>''')
+    items_html = ''.join(parts)
     
     updated_str = generated_at.strftime('%b %d, %H:%M UTC')
     
@@ -590,19 +848,37 @@ def main():
     print(f"   Max age: {MAX_AGE_DAYS} days")
     print()
     
+    cache = load_cache()
+    new_cache = {}
+    results = {}
+    
+    # Fetches are network-bound, so run them concurrently
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        futures = {ex.submit(fetch_articles, q, cache.get(q)): q for q in QUERIES}
+        for i, future in enumerate(as_completed(futures)):
+            query = futures[future]
+            articles, entry = future.result()
+            if entry:
+                new_cache[query] = entry
+            results[query] = articles
+            print(f"  [{i+1}/{len(QUERIES)}] Fetched: {query}")
+            print(f"         → {len(articles)} results")
+    
+    save_cache(new_cache)
+    
+    # Combine in QUERIES order so dedup and tie-breaks don't depend on
+    # which request happened to finish first
     all_articles = []
-    
-    for i, query in enumerate(QUERIES):
-        print(f"  [{i+1}/{len(QUERIES)}] Fetching: {query}")
-        xml_data = fetch_google_news_rss(query)
-        articles = parse_rss(xml_data)
-        print(f"         → {len(articles)} results")
-        all_articles.extend(articles)
+    for query in QUERIES:
+        all_articles.extend(results[query])
     
     print(f"\n📊 Total raw articles: {len(all_articles)}")
     
+    # Single reference time for filtering, scoring and display
+    now = datetime.now(timezone.utc)
+    
     # Filter by date
-    all_articles = filter_by_date(all_articles, MAX_AGE_DAYS)
+    all_articles = filter_by_date(all_articles, MAX_AGE_DAYS, now)
     print(f"   After date filter: {len(all_articles)}")
     
     # Deduplicate
@@ -613,14 +889,11 @@ def main():
     scored = []
     for a in all_articles:
         tags = assign_tags(a)
-        score = score_article(a, tags)
+        score = score_article(a, tags, now)
         scored.append((a, tags, score))
     
-    # Sort by score descending
-    scored.sort(key=lambda x: x[2], reverse=True)
-    
-    # Take top N
-    top = scored[:MAX_ITEMS]
+    # Take top N by score (ties keep QUERIES order, as a stable sort would)
+    top = heapq.nlargest(MAX_ITEMS, scored, key=lambda x: x[2])
     
     # Re-sort top items by date (newest first) for display
     top.sort(key=lambda x: x[0]['date'] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
@@ -631,14 +904,22 @@ def main():
         print(f"\n📰 Top articles:")
         for a, tags, score in top:
             print(f"   [{score:3d}] {a['title'][:80]}...")
-            print(f"         {', '.join(tags)} | {a['source']} | {format_date(a['date'])}")
+            print(f"         {', '.join(tags)} | {a['source']} | {format_date(a['date'], now)}")
     
     # Generate HTML
-    now = datetime.now(timezone.utc)
     html_content = generate_html(top, now)
     
-    with open('index.html', 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    # Write to a temp file and rename so a partial page is never served
+    tmp = 'index.html.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(html_content)
+        os.replace(tmp, 'index.html')
+    except BaseException:
+        # Don't leave the temp file behind for the Pages deploy to publish
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
     
     print(f"\n✅ Generated index.html ({len(html_content)} bytes)")
 